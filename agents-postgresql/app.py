@@ -1,148 +1,302 @@
-from flask import Flask, request, jsonify, render_template
-from openai import AzureOpenAI
-import psycopg2
-import os
-import asyncio
-from dotenv import load_dotenv
-from datetime import datetime
-from database import DatabaseFactory
-
-# =====================================================
-# INIT
-# =====================================================
-load_dotenv()
-app = Flask(__name__)
-
-# =====================================================
-# AZURE OPENAI CONFIG
-# =====================================================
-client = AzureOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version="2024-12-01-preview"
-)
-
-AZURE_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-
-# =====================================================
-# POSTGRES CONFIG
-# =====================================================
-POSTGRES_HOST = os.getenv("POSTGRES_HOST")
-POSTGRES_DATABASE = os.getenv("POSTGRES_DATABASE")
-POSTGRES_USER = os.getenv("POSTGRES_USER")
-POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
-
-
-def get_pg_connection():
-    return psycopg2.connect(
-        host=POSTGRES_HOST,
-        dbname=POSTGRES_DATABASE,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD,
-        port=5432,
-        sslmode="require",
-    )
-
-# =====================================================
-# =====================================================
-# AI LOGIC
-# =====================================================
-def generate_ai_response(customer_id, user_message):
-    """Generate AI response using Azure OpenAI with customer context"""
-    
-    # Get database type from environment
-    db_type = os.getenv("DB_TYPE", "postgresql")
-    
-    # Create appropriate database adapter
-    db = DatabaseFactory.create_adapter(db_type)
-    
-    # Get customer context from database
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    customer_context = loop.run_until_complete(db.get_customer_context(customer_id))
-    
-    if not customer_context:
-        return "I couldn't find your customer information. Please verify your customer ID."
-    
-    # Get conversation history
-    conversation_history = loop.run_until_complete(db.get_conversation_history(customer_id))
-    
-    # Build system message with customer context
-    system_message = f"""You are a helpful customer service AI assistant for an e-commerce company.
-    
-Customer Information:
-- Name: {customer_context['name']}
-- Email: {customer_context['email']}
-- Phone: {customer_context['phone']}
-- Total Orders: {customer_context['total_orders']}
-- Total Spent: ${customer_context['total_spent']:.2f}
-
-Recent Orders:
-{chr(10).join([f"- Order #{order['order_id']}: {order['products']} (${order['amount']:.2f}, Status: {order['status']}, Date: {order['date']})" 
-              for order in customer_context['recent_orders']])}
-
-Provide helpful, personalized responses based on this customer's history. Be friendly and professional."""
-    
-    # Build messages for API call
-    messages = [{"role": "system", "content": system_message}]
-    
-    # Add conversation history
-    for entry in conversation_history:
-        messages.append({"role": "user", "content": entry['user']})
-        messages.append({"role": "assistant", "content": entry['assistant']})
-    
-    # Add current message
-    messages.append({"role": "user", "content": user_message})
-    
-    # Call Azure OpenAI
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-        messages=messages,
-        temperature=0.7,
-        max_tokens=500
-    )
-    
-    ai_response = response.choices[0].message.content
-    
-    # Save conversation to database
-    loop.run_until_complete(db.store_conversation(customer_id, user_message, ai_response))
-    
-    return ai_response
-
-# =====================================================
-# ROUTES
-# =====================================================
-@app.route("/")
-def index():
-    return render_template("index.html")
-
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    data = request.json
-    if not data.get("customer_id") or not data.get("message"):
-        return jsonify({"error": "customer_id and message required"}), 400
-
-    try:
-        reply = generate_ai_response(data["customer_id"], data["message"])
-        return jsonify({"response": reply})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route("/api/customers")
-def customers():
-    try:
-        with get_pg_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT customer_id, first_name, last_name, email FROM customers")
-            rows = cursor.fetchall()
-
-        return jsonify([{ "id": r[0], "name": f"{r[1]} {r[2]}", "email": r[3]} for r in rows])
-    except Exception as e:
-        # Surface DB errors to help diagnose
-        return jsonify({"error": str(e)}), 500
-
-# =====================================================
-# MAIN
-# =====================================================
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+from quart import Quart, Response, request, render_template
+from openai import AsyncAzureOpenAI
+import httpx
+import orjson
+import os
+import asyncio
+import hashlib
+import time
+from dotenv import load_dotenv
+from datetime import datetime
+from database import DatabaseFactory
+
+# =====================================================
+# INIT
+# =====================================================
+load_dotenv()
+app = Quart(__name__)
+
+# Compact JSON in declaration order: no alphabetical re-sort, no
+# pretty-print whitespace on the wire
+app.json.sort_keys = False
+app.json.compact = True
+
+
+def ojson(obj, status=200):
+    """orjson-serialized JSON response; several times faster than stdlib json"""
+    return app.response_class(orjson.dumps(obj), status=status, mimetype="application/json")
+
+# =====================================================
+# AZURE OPENAI CONFIG
+# =====================================================
+# One async client for the process: keep-alive connections skip the
+# per-call TCP+TLS handshake, and HTTP/2 multiplexes concurrent chats
+# over a single connection.
+client = AsyncAzureOpenAI(
+    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+    api_version="2024-12-01-preview",
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, keepalive_expiry=120),
+    )
+)
+
+AZURE_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+# Deployment name for embeddings; when unset the semantic cache stays
+# disabled rather than paying a doomed embeddings call per chat turn
+EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+
+# Upper bound on any single OpenAI call so a stalled upstream can't hold
+# a request open indefinitely
+OPENAI_TIMEOUT = 15
+
+# =====================================================
+# DATABASE
+# =====================================================
+# One adapter for the process: DB_TYPE is constant, and a shared adapter
+# is what lets the connection pool and write buffer persist across requests
+DB = DatabaseFactory.create_adapter(os.getenv("DB_TYPE", "postgresql"))
+
+# =====================================================
+# PROMPT TEMPLATE
+# =====================================================
+# Built once; each request fills it with a single format_map instead of
+# re-assembling the prompt from per-field f-strings
+SYSTEM_TEMPLATE = (
+    "You are a helpful customer service AI assistant for an e-commerce company.\n"
+    "\n"
+    "Customer Information:\n"
+    "- Name: {name}\n"
+    "- Email: {email}\n"
+    "- Phone: {phone}\n"
+    "- Total Orders: {total_orders}\n"
+    "- Total Spent: ${total_spent}\n"
+    "\n"
+    "Provide helpful, personalized responses based on this customer's history. "
+    "Be friendly and professional."
+)
+
+# =====================================================
+# =====================================================
+# AI LOGIC
+# =====================================================
+# Strong references to in-flight persist tasks: the loop itself only keeps
+# weak ones, so an unreferenced task can be garbage-collected before it runs
+_background_tasks = set()
+
+
+async def _persist_turn(db, customer_id, user_message, query_embedding, ai_response):
+    """Store the finished turn (and cache entry) off the streaming path"""
+    # The generated conversation id is unused here, so take the buffered
+    # batch-insert path when the adapter offers one
+    if hasattr(db, "enqueue_conversation"):
+        await db.enqueue_conversation(customer_id, user_message, ai_response)
+    else:
+        await db.store_conversation(customer_id, user_message, ai_response)
+    if db.semantic_cache is not None and query_embedding is not None:
+        await db.semantic_cache.store(customer_id, user_message, query_embedding, ai_response)
+
+
+async def generate_ai_response(customer_id, user_message):
+    """Stream AI response chunks using Azure OpenAI with customer context"""
+
+    db = DB
+
+    # Semantic cache: near-duplicate questions skip the LLM call entirely
+    query_embedding = None
+    if db.semantic_cache is not None:
+        try:
+            embedding_response = await asyncio.wait_for(
+                client.embeddings.create(
+                    model=EMBEDDING_DEPLOYMENT,
+                    input=user_message,
+                ),
+                timeout=OPENAI_TIMEOUT,
+            )
+            query_embedding = embedding_response.data[0].embedding
+            cached = await db.semantic_cache.lookup(customer_id, query_embedding)
+            if cached is not None:
+                await _persist_turn(db, customer_id, user_message, None, cached)
+                yield cached
+                return
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+
+    # Get customer context, recent orders and history in a single round-trip
+    customer_context = await db.get_chat_bundle(customer_id)
+
+    if not customer_context:
+        yield "I couldn't find your customer information. Please verify your customer ID."
+        return
+
+    conversation_history = customer_context["history"]
+    
+    # Fill the precompiled template in one pass; the result stays a
+    # byte-stable prefix (deterministic field order, no timestamps,
+    # rounding only on display) so the provider's prompt cache still hits.
+    system_message = SYSTEM_TEMPLATE.format_map(customer_context)
+
+    # Orders live in their own message so the main system prompt stays stable
+    orders_block = "\n".join(
+        f"- Order #{order['order_id']}: {order['products']} "
+        f"(${order['amount']}, Status: {order['status']}, Date: {order['date']})"
+        for order in customer_context["recent_orders"]
+    )
+
+    # Build messages for API call
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "system", "content": f"Recent Orders:\n{orders_block}"},
+    ]
+
+    # Add conversation history
+    for entry in conversation_history:
+        messages.append({"role": "user", "content": entry['user']})
+        messages.append({"role": "assistant", "content": entry['assistant']})
+
+    # Add current message
+    messages.append({"role": "user", "content": user_message})
+
+    # Call Azure OpenAI, routing to a warm prompt cache per customer, and
+    # relay tokens to the caller as they arrive instead of buffering the
+    # full completion.
+    response = await asyncio.wait_for(
+        client.chat.completions.create(
+            model=AZURE_DEPLOYMENT,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500,
+            stream=True,
+            extra_body={"prompt_cache_key": f"cust:{customer_id}"}
+        ),
+        timeout=OPENAI_TIMEOUT,
+    )
+
+    parts = []
+    async for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    # Persist in the background so the final event isn't delayed by the write
+    ai_response = "".join(parts)
+    task = asyncio.create_task(
+        _persist_turn(db, customer_id, user_message, query_embedding, ai_response)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+# =====================================================
+# ROUTES
+# =====================================================
+INDEX_HTML = None
+
+
+@app.before_serving
+async def render_index():
+    # The landing page is static per process; render the Jinja template
+    # once at startup instead of re-reading and re-rendering it per hit
+    global INDEX_HTML
+    INDEX_HTML = await render_template("index.html")
+
+
+@app.after_serving
+async def drain_writes():
+    # Flush any buffered conversation turns before the worker exits so an
+    # accepted turn is never lost to a restart
+    if hasattr(DB, "drain_writes"):
+        await DB.drain_writes()
+
+
+@app.route("/")
+async def index():
+    return Response(
+        INDEX_HTML,
+        mimetype="text/html",
+        headers={"Cache-Control": "public, max-age=300"},
+    )
+
+@app.route("/api/chat", methods=["POST"])
+async def chat():
+    data = await request.get_json()
+    if not data.get("customer_id") or not data.get("message"):
+        return ojson({"error": "customer_id and message required"}, 400)
+
+    customer_id = data["customer_id"]
+    user_message = data["message"]
+
+    # Pull the first chunk before committing to a streamed response so an
+    # upstream timeout can still surface as a proper 504.
+    stream = generate_ai_response(customer_id, user_message)
+    try:
+        first_delta = await stream.__anext__()
+    except StopAsyncIteration:
+        first_delta = None
+    except asyncio.TimeoutError:
+        return ojson({"error": "The AI service timed out. Please try again."}, 504)
+    except Exception as e:
+        # Anything else raised before the first chunk (bad customer id, DB
+        # down, auth failure) can still be a proper error status instead of
+        # a 200 that dies mid-stream
+        return ojson({"error": str(e)}, 500)
+
+    async def generate():
+        try:
+            if first_delta is not None:
+                yield b"data: " + orjson.dumps({"delta": first_delta}) + b"\n\n"
+                async for delta in stream:
+                    yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+        except Exception as e:
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    return Response(generate(), mimetype="text/event-stream")
+
+# The customers list changes rarely but the frontend dropdown fetches it
+# on every page load; cache the serialized body briefly and honor
+# If-None-Match so repeat loads skip the query entirely.
+CUSTOMERS_CACHE_TTL = 60
+_customers_cache = {"body": None, "etag": None, "expires": 0.0}
+
+
+@app.route("/api/customers")
+async def customers():
+    try:
+        if _customers_cache["body"] is None or time.monotonic() >= _customers_cache["expires"]:
+            # Cold path: pull the list through the server-side cursor
+            # (constant memory per batch) and buffer the serialized body —
+            # the dropdown list is bounded, and a buffered body is what
+            # lets every response carry an ETag.
+            chunks = []
+            async for customer in DB.stream_customers():
+                chunks.append(orjson.dumps(customer))
+            body = b"[" + b",".join(chunks) + b"]"
+            _customers_cache["body"] = body
+            _customers_cache["etag"] = '"' + hashlib.md5(body).hexdigest() + '"'
+            _customers_cache["expires"] = time.monotonic() + CUSTOMERS_CACHE_TTL
+
+        etag = _customers_cache["etag"]
+        if request.headers.get("If-None-Match") == etag:
+            return Response("", status=304, headers={"ETag": etag})
+        return Response(
+            _customers_cache["body"],
+            mimetype="application/json",
+            headers={"ETag": etag},
+        )
+    except Exception as e:
+        # Surface DB errors to help diagnose
+        return ojson({"error": str(e)}, 500)
+
+# =====================================================
+# MAIN
+# =====================================================
+# Production: one worker per core on uvloop, e.g.
+#   hypercorn app:app --bind 0.0.0.0:5000 --workers $(nproc) --worker-class uvloop
+# The block below is a convenience for local runs only; the Werkzeug-style
+# debug server (reloader + interactive debugger) must never serve traffic.
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
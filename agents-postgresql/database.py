@@ -1,320 +1,747 @@
-# database.py - Database Abstraction Layer
-
-import os
-import json
-from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
-import asyncio
-from datetime import datetime
-
-
-class DatabaseAdapter(ABC):
-    """Abstract base class for database adapters"""
-
-    @abstractmethod
-    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
-        pass
-
-    @abstractmethod
-    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
-        pass
-
-    @abstractmethod
-    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
-        pass
-
-
-class PostgreSQLAdapter(DatabaseAdapter):
-    """Adapter for Azure Database for PostgreSQL with pgvector"""
-
-    def __init__(self, connection_string: str):
-        import psycopg2
-
-        self.psycopg2 = psycopg2
-        self.connection_string = connection_string
-
-    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
-        try:
-            conn = self.psycopg2.connect(self.connection_string)
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                INSERT INTO conversation_history (customer_id, user_message, ai_response)
-                VALUES (%s, %s, %s)
-                RETURNING id
-                """,
-                (customer_id, user_message, ai_response),
-            )
-
-            conversation_id = cursor.fetchone()[0]
-            conn.commit()
-            conn.close()
-
-            return conversation_id
-        except Exception as e:
-            print(f"PostgreSQL Error storing conversation: {e}")
-            raise
-
-    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
-        try:
-            conn = self.psycopg2.connect(self.connection_string)
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                SELECT user_message, ai_response, timestamp
-                FROM conversation_history
-                WHERE customer_id = %s
-                ORDER BY timestamp DESC
-                LIMIT %s
-                """,
-                (customer_id, limit),
-            )
-
-            rows = cursor.fetchall()
-            conn.close()
-
-            return [
-                {
-                    "user": row[0],
-                    "assistant": row[1],
-                    "timestamp": row[2].strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                for row in reversed(rows)
-            ]
-        except Exception as e:
-            print(f"PostgreSQL Error retrieving history: {e}")
-            raise
-
-    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
-        try:
-            conn = self.psycopg2.connect(self.connection_string)
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                  SELECT c.first_name, c.last_name, c.email, c.phone,
-                      COUNT(o.order_id) as total_orders,
-                      COALESCE(SUM(o.total_amount), 0) as total_spent
-                  FROM customers c
-                  LEFT JOIN orders o ON c.customer_id = o.customer_id
-                  WHERE c.customer_id = %s
-                  GROUP BY c.customer_id, c.first_name, c.last_name, c.email, c.phone
-                """,
-                (customer_id,),
-            )
-
-            customer = cursor.fetchone()
-
-            if not customer:
-                conn.close()
-                return None
-
-            cursor.execute(
-                """
-                  SELECT o.order_id, o.order_date, o.total_amount, o.status,
-                      STRING_AGG(p.product_name, ', ') as products
-                  FROM orders o
-                  JOIN order_items oi ON o.order_id = oi.order_id
-                  JOIN products p ON oi.product_id = p.product_id
-                  WHERE o.customer_id = %s
-                  GROUP BY o.order_id, o.order_date, o.total_amount, o.status
-                  ORDER BY o.order_date DESC
-                  LIMIT 5
-                """,
-                (customer_id,),
-            )
-
-            orders = cursor.fetchall()
-            conn.close()
-
-            return {
-                "name": f"{customer[0]} {customer[1]}",
-                "email": customer[2],
-                "phone": customer[3],
-                "total_orders": customer[4],
-                "total_spent": float(customer[5]),
-                "recent_orders": [
-                    {
-                        "order_id": order[0],
-                        "date": order[1].strftime("%Y-%m-%d"),
-                        "amount": float(order[2]),
-                        "status": order[3],
-                        "products": order[4],
-                    }
-                    for order in orders
-                ],
-            }
-        except Exception as e:
-            print(f"PostgreSQL Error retrieving customer context: {e}")
-            raise
-
-
-class SQLDatabaseAdapter(DatabaseAdapter):
-    """Adapter for Azure SQL Database via pyodbc"""
-
-    def __init__(self, connection_string: str):
-        import pyodbc
-
-        self.pyodbc = pyodbc
-        self.connection_string = connection_string
-
-    def _get_conn(self):
-        return self.pyodbc.connect(self.connection_string)
-
-    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
-        def _store():
-            with self._get_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO ConversationHistory (CustomerID, UserMessage, AIResponse)
-                    OUTPUT INSERTED.ID
-                    VALUES (?, ?, ?)
-                    """,
-                    customer_id,
-                    user_message,
-                    ai_response,
-                )
-                row = cursor.fetchone()
-                conn.commit()
-                return row[0]
-
-        return await asyncio.to_thread(_store)
-
-    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
-        def _fetch():
-            with self._get_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    SELECT TOP (?) UserMessage, AIResponse, Timestamp
-                    FROM ConversationHistory
-                    WHERE CustomerID = ?
-                    ORDER BY Timestamp DESC
-                    """,
-                    limit,
-                    customer_id,
-                )
-                rows = cursor.fetchall()
-
-            return [
-                {
-                    "user": r[0],
-                    "assistant": r[1],
-                    "timestamp": r[2].strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                for r in reversed(rows)
-            ]
-
-        return await asyncio.to_thread(_fetch)
-
-    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
-        def _fetch_context():
-            with self._get_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    SELECT c.FirstName, c.LastName, c.Email, c.Phone,
-                           COUNT(o.OrderID) as total_orders,
-                           SUM(o.TotalAmount) as total_spent
-                    FROM Customers c
-                    LEFT JOIN Orders o ON c.CustomerID = o.CustomerID
-                    WHERE c.CustomerID = ?
-                    GROUP BY c.CustomerID, c.FirstName, c.LastName, c.Email, c.Phone
-                    """,
-                    customer_id,
-                )
-                customer = cursor.fetchone()
-
-                if not customer:
-                    return None
-
-                cursor.execute(
-                    """
-                    SELECT TOP 5 o.OrderID, o.OrderDate, o.TotalAmount, o.Status,
-                           STRING_AGG(p.ProductName, ', ')
-                    FROM Orders o
-                    JOIN OrderItems oi ON o.OrderID = oi.OrderID
-                    JOIN Products p ON oi.ProductID = p.ProductID
-                    WHERE o.CustomerID = ?
-                    GROUP BY o.OrderID, o.OrderDate, o.TotalAmount, o.Status
-                    ORDER BY o.OrderDate DESC
-                    """,
-                    customer_id,
-                )
-                orders = cursor.fetchall()
-
-            return {
-                "name": f"{customer[0]} {customer[1]}",
-                "email": customer[2],
-                "phone": customer[3],
-                "total_orders": customer[4],
-                "total_spent": float(customer[5]) if customer[5] else 0,
-                "recent_orders": [
-                    {
-                        "order_id": o[0],
-                        "date": o[1].strftime("%Y-%m-%d"),
-                        "amount": float(o[2]),
-                        "status": o[3],
-                        "products": o[4],
-                    }
-                    for o in orders
-                ],
-            }
-
-        return await asyncio.to_thread(_fetch_context)
-
-
-class CosmosDBAdapter(DatabaseAdapter):
-    """Placeholder adapter for Azure Cosmos DB."""
-
-    def __init__(self, connection_string: str):
-        self.connection_string = connection_string
-
-    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
-        raise NotImplementedError("CosmosDBAdapter.store_conversation is not implemented")
-
-    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
-        raise NotImplementedError("CosmosDBAdapter.get_conversation_history is not implemented")
-
-    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
-        raise NotImplementedError("CosmosDBAdapter.get_customer_context is not implemented")
-
-
-class DatabaseFactory:
-    """Factory to create appropriate database adapter"""
-
-    @staticmethod
-    def create_adapter(db_type: str) -> DatabaseAdapter:
-        db_type = db_type.lower()
-
-        if db_type == "sql":
-            connection_string = (
-                "DRIVER={ODBC Driver 18 for SQL Server};"
-                f"SERVER={os.getenv('SQL_SERVER')};"
-                f"DATABASE={os.getenv('SQL_DATABASE')};"
-                f"UID={os.getenv('SQL_USER')};"
-                f"PWD={os.getenv('SQL_PASSWORD')};"
-                "Encrypt=yes;"
-                "TrustServerCertificate=yes;"
-                "Connection Timeout=30;"
-            )
-            return SQLDatabaseAdapter(connection_string)
-
-        if db_type == "cosmos":
-            return CosmosDBAdapter(os.getenv("COSMOS_CONNECTION_STRING"))
-
-        if db_type == "postgresql":
-            connection_string = (
-                f"host={os.getenv('POSTGRES_HOST')} "
-                f"port=5432 "
-                f"dbname={os.getenv('POSTGRES_DATABASE')} "
-                f"user={os.getenv('POSTGRES_USER')} "
-                f"password={os.getenv('POSTGRES_PASSWORD')} "
-                f"sslmode=require"
-            )
-            return PostgreSQLAdapter(connection_string)
-
-        raise ValueError(f"Unknown database type: {db_type}")
+# database.py - Database Abstraction Layer
+
+import os
+import json
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from urllib.parse import quote
+import asyncio
+from datetime import datetime
+
+import asyncpg
+import pyodbc
+
+
+class DatabaseAdapter(ABC):
+    """Abstract base class for database adapters"""
+
+    # Optional semantic response cache; only backends with vector support set it
+    semantic_cache = None
+
+    @abstractmethod
+    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
+        pass
+
+    @abstractmethod
+    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
+        pass
+
+    @abstractmethod
+    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def stream_customers(self, batch_size: int = 2000):
+        """Stream customer rows in batches without materializing the full list"""
+
+    async def get_chat_bundle(self, customer_id: int, history_limit: int = 5) -> Optional[Dict]:
+        """Customer context plus conversation history as one document.
+
+        Default composition over get_customer_context and
+        get_conversation_history, run concurrently; backends that can fold
+        the whole bundle into a single query override this.
+        """
+        customer_context, history = await asyncio.gather(
+            self.get_customer_context(customer_id),
+            self.get_conversation_history(customer_id, history_limit),
+        )
+        if customer_context is None:
+            return None
+        customer_context["history"] = history
+        return customer_context
+
+
+class SemanticCache:
+    """pgvector-backed semantic cache for chat responses.
+
+    Near-duplicate questions from the same customer are answered from the
+    cache instead of re-invoking the LLM. Entries expire after an hour and
+    a hit requires cosine distance below the threshold.
+    """
+
+    DISTANCE_THRESHOLD = 0.12
+
+    def __init__(self, adapter: "PostgreSQLAdapter"):
+        self.adapter = adapter
+        self._table_ready = False
+
+    async def _ensure_table(self, conn) -> None:
+        if self._table_ready:
+            return
+        await conn.execute(
+            """
+            CREATE EXTENSION IF NOT EXISTS vector;
+            CREATE TABLE IF NOT EXISTS chat_cache (
+                id SERIAL PRIMARY KEY,
+                customer_id INT NOT NULL,
+                user_message TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding vector(1536) NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """
+        )
+        self._table_ready = True
+
+    @staticmethod
+    def _to_vector(embedding: List[float]) -> str:
+        # pgvector accepts its literal text form; cast server-side with ::vector
+        return "[" + ",".join(str(v) for v in embedding) + "]"
+
+    async def lookup(self, customer_id: int, embedding: List[float]) -> Optional[str]:
+        try:
+            pool = await self.adapter._get_pool()
+            async with pool.acquire() as conn:
+                await self._ensure_table(conn)
+                row = await conn.fetchrow(
+                    """
+                    SELECT response, embedding <=> $2::vector AS distance
+                    FROM chat_cache
+                    WHERE customer_id = $1
+                      AND created_at > now() - interval '1 hour'
+                    ORDER BY embedding <=> $2::vector
+                    LIMIT 1
+                    """,
+                    customer_id,
+                    self._to_vector(embedding),
+                )
+
+            if row and row["distance"] < self.DISTANCE_THRESHOLD:
+                return row["response"]
+            return None
+        except Exception as e:
+            # A broken cache should never break the chat path
+            print(f"PostgreSQL Error reading semantic cache: {e}")
+            return None
+
+    async def store(self, customer_id: int, user_message: str, embedding: List[float], response: str) -> None:
+        try:
+            pool = await self.adapter._get_pool()
+            async with pool.acquire() as conn:
+                await self._ensure_table(conn)
+                await conn.execute(
+                    """
+                    INSERT INTO chat_cache (customer_id, user_message, response, embedding)
+                    VALUES ($1, $2, $3, $4::vector)
+                    """,
+                    customer_id,
+                    user_message,
+                    response,
+                    self._to_vector(embedding),
+                )
+        except Exception as e:
+            print(f"PostgreSQL Error writing semantic cache: {e}")
+
+
+# Customer context, recent orders and conversation history folded into a
+# single statement so a chat turn costs one round-trip instead of three.
+# Dates and amounts are formatted server-side with to_char, so the JSONB
+# document needs no Python-side post-processing.
+CHAT_BUNDLE_SQL = """
+WITH cust AS (
+    SELECT c.first_name, c.last_name, c.email, c.phone,
+        COUNT(o.order_id) AS total_orders,
+        to_char(COALESCE(SUM(o.total_amount), 0), 'FM999990.00') AS total_spent
+    FROM customers c
+    LEFT JOIN orders o ON c.customer_id = o.customer_id
+    WHERE c.customer_id = $1
+    GROUP BY c.customer_id, c.first_name, c.last_name, c.email, c.phone
+),
+ord AS (
+    SELECT o.order_id,
+        to_char(o.order_date, 'YYYY-MM-DD') AS date,
+        to_char(o.total_amount, 'FM999990.00') AS amount, o.status,
+        STRING_AGG(p.product_name, ', ') AS products
+    FROM orders o
+    JOIN order_items oi ON o.order_id = oi.order_id
+    JOIN products p ON oi.product_id = p.product_id
+    WHERE o.customer_id = $1
+    GROUP BY o.order_id, o.order_date, o.total_amount, o.status
+    ORDER BY o.order_date DESC
+    LIMIT 5
+),
+hist AS (
+    SELECT user_message, ai_response,
+        to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS') AS ts
+    FROM conversation_history
+    WHERE customer_id = $1
+    ORDER BY timestamp DESC
+    LIMIT $2
+)
+SELECT jsonb_build_object(
+    'customer', (SELECT row_to_json(cust) FROM cust),
+    'orders', COALESCE(
+        (SELECT jsonb_agg(to_jsonb(o) ORDER BY o.date DESC) FROM ord o),
+        '[]'::jsonb),
+    'history', COALESCE(
+        (SELECT jsonb_agg(jsonb_build_object(
+             'user', h.user_message,
+             'assistant', h.ai_response,
+             'timestamp', h.ts) ORDER BY h.ts ASC)
+         FROM hist h),
+        '[]'::jsonb)
+)
+"""
+
+
+class PostgreSQLAdapter(DatabaseAdapter):
+    """Adapter for Azure Database for PostgreSQL with pgvector"""
+
+    # How long buffered conversation writes may wait before being flushed
+    FLUSH_INTERVAL = 0.1
+    # Flush attempts per buffered turn before it is dropped
+    MAX_WRITE_RETRIES = 3
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.pool: Optional[asyncpg.Pool] = None
+        self._pool_lock = asyncio.Lock()
+        # The cache is only useful when an embedding deployment is
+        # configured; without one, leave it at the class default (None)
+        if os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT"):
+            self.semantic_cache = SemanticCache(self)
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        """Create the shared connection pool on first use.
+
+        The pool keeps warm TLS connections open, so per-call connect/TLS/auth
+        handshakes are paid once instead of on every query.
+        """
+        if self.pool is None:
+            async with self._pool_lock:
+                if self.pool is None:
+                    self.pool = await asyncpg.create_pool(
+                        dsn=self.dsn,
+                        min_size=4,
+                        max_size=20,
+                        ssl="require",
+                        init=self._init_connection,
+                        # Repeated statements (chat bundle, inserts) are
+                        # prepared once per connection and reused, skipping
+                        # server-side parse/plan on every call
+                        statement_cache_size=256,
+                    )
+        return self.pool
+
+    @staticmethod
+    async def _init_connection(conn) -> None:
+        # Decode jsonb columns straight into Python dicts/lists.
+        await conn.set_type_codec(
+            "jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        )
+        # Bound worst-case query time so one stuck statement can't pin a
+        # pooled connection and cascade into pool exhaustion; tag the
+        # session so it is identifiable in pg_stat_activity.
+        await conn.execute(
+            "SET statement_timeout = 5000; "
+            "SET idle_in_transaction_session_timeout = 10000; "
+            "SET application_name = 'agents-chat'"
+        )
+
+    async def stream_customers(self, batch_size: int = 2000):
+        # Server-side cursor: the server hands rows over in prefetch-sized
+        # batches instead of one fetchall, so memory stays constant and the
+        # first rows are available immediately. asyncpg cursors require an
+        # open transaction.
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                async for record in conn.cursor(
+                    "SELECT customer_id, first_name, last_name, email FROM customers",
+                    prefetch=batch_size,
+                ):
+                    yield {
+                        "id": record["customer_id"],
+                        "name": f"{record['first_name']} {record['last_name']}",
+                        "email": record["email"],
+                    }
+
+    async def get_chat_bundle(self, customer_id: int, history_limit: int = 5) -> Optional[Dict]:
+        """Fetch customer context, recent orders and history in one round-trip."""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                bundle = await conn.fetchval(CHAT_BUNDLE_SQL, customer_id, history_limit)
+
+            if not bundle or bundle["customer"] is None:
+                return None
+
+            customer = bundle["customer"]
+            return {
+                "name": f"{customer['first_name']} {customer['last_name']}",
+                "email": customer["email"],
+                "phone": customer["phone"],
+                "total_orders": customer["total_orders"],
+                "total_spent": customer["total_spent"],
+                "recent_orders": bundle["orders"],
+                "history": bundle["history"],
+            }
+        except Exception as e:
+            print(f"PostgreSQL Error retrieving chat bundle: {e}")
+            raise
+
+    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                conversation_id = await conn.fetchval(
+                    """
+                    INSERT INTO conversation_history (customer_id, user_message, ai_response)
+                    VALUES ($1, $2, $3)
+                    RETURNING id
+                    """,
+                    customer_id,
+                    user_message,
+                    ai_response,
+                )
+
+            return conversation_id
+        except Exception as e:
+            print(f"PostgreSQL Error storing conversation: {e}")
+            raise
+
+    async def enqueue_conversation(self, customer_id: int, user_message: str, ai_response: str) -> None:
+        """Buffer a turn for batched insertion.
+
+        Writes queued within FLUSH_INTERVAL are folded into one
+        executemany, so bursty load costs one round-trip per batch
+        instead of one per turn. Use store_conversation when the
+        generated id is actually needed.
+        """
+        self._write_queue.put_nowait((customer_id, user_message, ai_response, 0))
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_writes())
+
+    def _drain_queue(self) -> list:
+        rows = []
+        while True:
+            try:
+                rows.append(self._write_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return rows
+
+    async def _flush_writes(self) -> None:
+        while True:
+            # Block until there is something to write, then let the burst
+            # accumulate for one interval before flushing it as a batch
+            first = await self._write_queue.get()
+            try:
+                await asyncio.sleep(self.FLUSH_INTERVAL)
+            except asyncio.CancelledError:
+                # Hand the popped row back so a shutdown drain still sees it
+                self._write_queue.put_nowait(first)
+                raise
+            # Shield the flush: its rows are already off the queue, so a
+            # cancel landing mid-write must let the batch finish (or fail
+            # and re-queue itself) instead of dropping it
+            flush = asyncio.shield(self._flush_rows([first] + self._drain_queue()))
+            try:
+                await flush
+            except asyncio.CancelledError:
+                await flush
+                raise
+
+    async def _flush_rows(self, rows) -> None:
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                await conn.executemany(
+                    """
+                    INSERT INTO conversation_history (customer_id, user_message, ai_response)
+                    VALUES ($1, $2, $3)
+                    """,
+                    [row[:3] for row in rows],
+                )
+        except Exception as e:
+            print(f"PostgreSQL Error flushing conversation batch: {e}")
+            # Re-queue for a later flush rather than dropping the turns;
+            # give up per row after MAX_WRITE_RETRIES attempts
+            for customer_id, user_message, ai_response, attempts in rows:
+                if attempts + 1 < self.MAX_WRITE_RETRIES:
+                    self._write_queue.put_nowait((customer_id, user_message, ai_response, attempts + 1))
+                else:
+                    print(f"PostgreSQL Dropping conversation turn for customer {customer_id} after {self.MAX_WRITE_RETRIES} failed flushes")
+
+    async def drain_writes(self) -> None:
+        """Flush everything still buffered; call at shutdown so no accepted
+        turn is lost to a worker restart."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        rows = self._drain_queue()
+        if rows:
+            await self._flush_rows(rows)
+
+    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                # The inner DESC LIMIT picks the latest rows off the covering
+                # index; the outer ORDER BY restores chronological order
+                # server-side, replacing the old reversed() post-pass.
+                rows = await conn.fetch(
+                    """
+                    SELECT user_message, ai_response, ts
+                    FROM (
+                        SELECT user_message, ai_response, timestamp,
+                            to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS') AS ts
+                        FROM conversation_history
+                        WHERE customer_id = $1
+                        ORDER BY timestamp DESC
+                        LIMIT $2
+                    ) t
+                    ORDER BY timestamp ASC
+                    """,
+                    customer_id,
+                    limit,
+                )
+
+            return [
+                {
+                    "user": row[0],
+                    "assistant": row[1],
+                    "timestamp": row[2],
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            print(f"PostgreSQL Error retrieving history: {e}")
+            raise
+
+    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
+        try:
+            pool = await self._get_pool()
+            # The aggregate and recent-orders queries are independent, so
+            # run them in parallel instead of paying two sequential DB
+            # round-trips. Pool-level fetches acquire and release their
+            # connection per call, so concurrent context fetches never hold
+            # one connection while waiting on a second.
+            customer, orders = await asyncio.gather(
+                pool.fetchrow(
+                    """
+                      SELECT c.first_name, c.last_name, c.email, c.phone,
+                          COUNT(o.order_id) as total_orders,
+                          to_char(COALESCE(SUM(o.total_amount), 0), 'FM999990.00') as total_spent
+                      FROM customers c
+                      LEFT JOIN orders o ON c.customer_id = o.customer_id
+                      WHERE c.customer_id = $1
+                      GROUP BY c.customer_id, c.first_name, c.last_name, c.email, c.phone
+                    """,
+                    customer_id,
+                ),
+                pool.fetch(
+                    """
+                      SELECT o.order_id,
+                          to_char(o.order_date, 'YYYY-MM-DD') as date,
+                          to_char(o.total_amount, 'FM999990.00') as amount,
+                          o.status,
+                          STRING_AGG(p.product_name, ', ') as products
+                      FROM orders o
+                      JOIN order_items oi ON o.order_id = oi.order_id
+                      JOIN products p ON oi.product_id = p.product_id
+                      WHERE o.customer_id = $1
+                      GROUP BY o.order_id, o.order_date, o.total_amount, o.status
+                      ORDER BY o.order_date DESC
+                      LIMIT 5
+                    """,
+                    customer_id,
+                ),
+            )
+
+            if not customer:
+                return None
+
+            return {
+                "name": f"{customer[0]} {customer[1]}",
+                "email": customer[2],
+                "phone": customer[3],
+                "total_orders": customer[4],
+                "total_spent": customer[5],
+                "recent_orders": [
+                    {
+                        "order_id": order[0],
+                        "date": order[1],
+                        "amount": order[2],
+                        "status": order[3],
+                        "products": order[4],
+                    }
+                    for order in orders
+                ],
+            }
+        except Exception as e:
+            print(f"PostgreSQL Error retrieving customer context: {e}")
+            raise
+
+
+class SQLDatabaseAdapter(DatabaseAdapter):
+    """Adapter for Azure SQL Database via pyodbc"""
+
+    POOL_SIZE = 4
+    # Bound on waiting for a pooled connection so a leaked or wedged
+    # connection can't block a worker thread forever
+    POOL_TIMEOUT = 30
+
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+        # Small pool of long-lived connections: the driver's parameter
+        # cache and the server's prepared plans survive across calls
+        # instead of being rebuilt on a fresh connection each time.
+        self._pool = queue.Queue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+
+    def _get_conn(self):
+        conn = pyodbc.connect(self.connection_string)
+        conn.setdecoding(pyodbc.SQL_CHAR, encoding="utf-8")
+        conn.setdecoding(pyodbc.SQL_WCHAR, encoding="utf-16le")
+        conn.autocommit = True
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._create_lock:
+            if self._created < self.POOL_SIZE:
+                self._created += 1
+                try:
+                    return self._get_conn()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._pool.get(timeout=self.POOL_TIMEOUT)
+
+    def _release(self, conn) -> None:
+        self._pool.put(conn)
+
+    def _discard(self, conn) -> None:
+        # A connection whose query just failed may be dead (idle-connection
+        # reaping, network blip); close it and make room for a fresh one
+        # instead of poisoning the pool with it.
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._create_lock:
+            self._created -= 1
+
+    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
+        def _store():
+            conn = self._acquire()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO ConversationHistory (CustomerID, UserMessage, AIResponse)
+                    OUTPUT INSERTED.ID
+                    VALUES (?, ?, ?)
+                    """,
+                    customer_id,
+                    user_message,
+                    ai_response,
+                )
+                row = cursor.fetchone()
+            except Exception:
+                self._discard(conn)
+                raise
+            self._release(conn)
+            return row[0]
+
+        return await asyncio.to_thread(_store)
+
+    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
+        def _fetch():
+            conn = self._acquire()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT TOP (?) UserMessage, AIResponse,
+                        CONVERT(varchar(19), Timestamp, 120)
+                    FROM ConversationHistory
+                    WHERE CustomerID = ?
+                    ORDER BY Timestamp DESC
+                    """,
+                    limit,
+                    customer_id,
+                )
+                rows = cursor.fetchall()
+            except Exception:
+                self._discard(conn)
+                raise
+            self._release(conn)
+
+            return [
+                {
+                    "user": r[0],
+                    "assistant": r[1],
+                    "timestamp": r[2],
+                }
+                for r in reversed(rows)
+            ]
+
+        return await asyncio.to_thread(_fetch)
+
+    async def stream_customers(self, batch_size: int = 2000):
+        def _open():
+            conn = self._get_conn()
+            cursor = conn.cursor()
+            cursor.execute("SELECT CustomerID, FirstName, LastName, Email FROM Customers")
+            return conn, cursor
+
+        conn, cursor = await asyncio.to_thread(_open)
+        try:
+            while True:
+                rows = await asyncio.to_thread(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield {"id": r[0], "name": f"{r[1]} {r[2]}", "email": r[3]}
+        finally:
+            await asyncio.to_thread(conn.close)
+
+    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
+        def _fetch_customer():
+            conn = self._acquire()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT c.FirstName, c.LastName, c.Email, c.Phone,
+                           COUNT(o.OrderID) as total_orders,
+                           FORMAT(COALESCE(SUM(o.TotalAmount), 0), '0.00') as total_spent
+                    FROM Customers c
+                    LEFT JOIN Orders o ON c.CustomerID = o.CustomerID
+                    WHERE c.CustomerID = ?
+                    GROUP BY c.CustomerID, c.FirstName, c.LastName, c.Email, c.Phone
+                    """,
+                    customer_id,
+                )
+                customer = cursor.fetchone()
+            except Exception:
+                self._discard(conn)
+                raise
+            self._release(conn)
+            return customer
+
+        def _fetch_orders():
+            conn = self._acquire()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT TOP 5 o.OrderID,
+                           CONVERT(varchar(10), o.OrderDate, 23),
+                           FORMAT(o.TotalAmount, '0.00'),
+                           o.Status,
+                           STRING_AGG(p.ProductName, ', ')
+                    FROM Orders o
+                    JOIN OrderItems oi ON o.OrderID = oi.OrderID
+                    JOIN Products p ON oi.ProductID = p.ProductID
+                    WHERE o.CustomerID = ?
+                    GROUP BY o.OrderID, o.OrderDate, o.TotalAmount, o.Status
+                    ORDER BY o.OrderDate DESC
+                    """,
+                    customer_id,
+                )
+                orders = cursor.fetchall()
+            except Exception:
+                self._discard(conn)
+                raise
+            self._release(conn)
+            return orders
+
+        # Independent queries; overlap the two round-trips on worker threads.
+        customer, orders = await asyncio.gather(
+            asyncio.to_thread(_fetch_customer),
+            asyncio.to_thread(_fetch_orders),
+        )
+
+        if not customer:
+            return None
+
+        return {
+            "name": f"{customer[0]} {customer[1]}",
+            "email": customer[2],
+            "phone": customer[3],
+            "total_orders": customer[4],
+            "total_spent": customer[5],
+            "recent_orders": [
+                {
+                    "order_id": o[0],
+                    "date": o[1],
+                    "amount": o[2],
+                    "status": o[3],
+                    "products": o[4],
+                }
+                for o in orders
+            ],
+        }
+
+
+class CosmosDBAdapter(DatabaseAdapter):
+    """Placeholder adapter for Azure Cosmos DB."""
+
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+
+    async def store_conversation(self, customer_id: int, user_message: str, ai_response: str) -> int:
+        raise NotImplementedError("CosmosDBAdapter.store_conversation is not implemented")
+
+    async def get_conversation_history(self, customer_id: int, limit: int = 5) -> List[Dict]:
+        raise NotImplementedError("CosmosDBAdapter.get_conversation_history is not implemented")
+
+    async def get_customer_context(self, customer_id: int) -> Optional[Dict]:
+        raise NotImplementedError("CosmosDBAdapter.get_customer_context is not implemented")
+
+    def stream_customers(self, batch_size: int = 2000):
+        raise NotImplementedError("CosmosDBAdapter.stream_customers is not implemented")
+
+
+class DatabaseFactory:
+    """Factory to create appropriate database adapter"""
+
+    @staticmethod
+    def create_adapter(db_type: str) -> DatabaseAdapter:
+        db_type = db_type.lower()
+
+        if db_type == "sql":
+            connection_string = (
+                "DRIVER={ODBC Driver 18 for SQL Server};"
+                f"SERVER={os.getenv('SQL_SERVER')};"
+                f"DATABASE={os.getenv('SQL_DATABASE')};"
+                f"UID={os.getenv('SQL_USER')};"
+                f"PWD={os.getenv('SQL_PASSWORD')};"
+                "Encrypt=yes;"
+                "TrustServerCertificate=yes;"
+                "Connection Timeout=30;"
+            )
+            return SQLDatabaseAdapter(connection_string)
+
+        if db_type == "cosmos":
+            return CosmosDBAdapter(os.getenv("COSMOS_CONNECTION_STRING"))
+
+        if db_type == "postgresql":
+            # asyncpg expects a URI-style DSN; TLS is requested via the
+            # ssl="require" argument on the pool rather than sslmode.
+            # Credentials are percent-encoded so passwords with URI
+            # delimiters (:/?#@) survive parsing.
+            user = quote(os.getenv("POSTGRES_USER", ""), safe="")
+            password = quote(os.getenv("POSTGRES_PASSWORD", ""), safe="")
+            dsn = (
+                f"postgresql://{user}:{password}"
+                f"@{os.getenv('POSTGRES_HOST')}:5432/{os.getenv('POSTGRES_DATABASE')}"
+            )
+            return PostgreSQLAdapter(dsn)
+
+        raise ValueError(f"Unknown database type: {db_type}")
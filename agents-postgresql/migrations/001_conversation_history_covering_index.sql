@@ -0,0 +1,7 @@
+-- Covering index for the conversation-history hot path.
+-- get_conversation_history filters on customer_id, orders by timestamp DESC
+-- and only reads user_message/ai_response, so with this index the query is
+-- satisfied by an index-only scan.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_history_customer_ts
+    ON conversation_history (customer_id, timestamp DESC)
+    INCLUDE (user_message, ai_response);